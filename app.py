@@ -1,10 +1,15 @@
 import os
 import sqlite3
-import json
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+import orjson
+import queue
+import functools
+import threading
+from contextlib import contextmanager
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response
 from werkzeug.security import generate_password_hash, check_password_hash
+from cachetools import LRUCache
 from src.agents.ai_agent import TutorAgent, AgentState
-from langchain_core.messages import messages_to_dict, messages_from_dict
+from langchain_core.messages import AIMessage, HumanMessage
 import datetime
 from dotenv import load_dotenv
 
@@ -16,111 +21,257 @@ app = Flask(__name__)
 # Use an environment variable for the secret key for better security
 app.secret_key = os.environ.get('SESSION_SECRET', 'dev_secret_key_change_in_production')
 
-# Use an in-memory cache for agent instances to avoid re-initializing them on every request
-agent_cache = {}
+# Explicit, tunable work factor for new password hashes. Werkzeug's default
+# pbkdf2 iteration count costs hundreds of ms of CPU per login/signin POST;
+# pinning it makes that cost a deliberate knob instead of a moving default.
+# Verification reads the parameters embedded in each stored hash, so
+# existing accounts keep working whatever this is set to.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:50000')
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect('users.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+# Use an in-memory cache for agent instances to avoid re-initializing them on
+# every request. Bounded: each TutorAgent holds an LLM client, a RAG pipeline
+# and a compiled graph, so letting the cache grow with every username ever
+# seen would leak memory. LRU eviction keeps the active users warm.
+agent_cache = LRUCache(maxsize=int(os.environ.get('AGENT_CACHE_SIZE', 256)))
+agent_cache_lock = threading.Lock()
+
+def get_agent(username):
+    """Returns the cached TutorAgent for a user, creating it on first use."""
+    with agent_cache_lock:
+        agent = agent_cache.get(username)
+        if agent is None:
+            agent = TutorAgent()
+            agent_cache[username] = agent
+    return agent
+
+def evict_agent(username):
+    """Drops a user's agent from the cache (e.g. when their session is cleared)."""
+    with agent_cache_lock:
+        agent_cache.pop(username, None)
+
+class ConnectionPool:
+    """
+    A small thread-safe pool of pre-opened SQLite connections.
+
+    Opening a connection per request thrashes the DB/WAL/SHM files and throws
+    away SQLite's per-connection page cache. Instead we open everything once:
+    a single read-write connection guarded by a lock (SQLite allows only one
+    writer anyway) and a LIFO stack of read-only connections for queries.
+    """
+    def __init__(self, database, readers=4):
+        self._database = database
+        self._write_lock = threading.Lock()
+        self._write_conn = self._open_connection()
+        self._readers = queue.LifoQueue(maxsize=readers)
+        for _ in range(readers):
+            self._readers.put(self._open_connection())
+
+    def _open_connection(self):
+        conn = sqlite3.connect(self._database, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-20000')
+        return conn
+
+    @contextmanager
+    def get(self, write=False):
+        """Borrows a connection from the pool as a context manager."""
+        if write:
+            with self._write_lock:
+                yield self._write_conn
+        else:
+            conn = self._readers.get()
+            try:
+                yield conn
+            finally:
+                self._readers.put(conn)
+
+pool = ConnectionPool('users.db')
+
+def reset_pool():
+    """Re-opens the connection pool with fresh connections.
+
+    SQLite connections are not fork-safe, so gunicorn's post_fork hook calls
+    this to give each worker its own pool instead of one inherited from the
+    master process.
+    """
+    global pool
+    pool = ConnectionPool('users.db')
 
 def init_db():
     """Initializes the SQLite database with required tables."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL
-        )
-    ''')
-    # Agent state table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS agent_state (
-            user_id INTEGER PRIMARY KEY,
-            state_json TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    # Chat history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            sender TEXT NOT NULL, -- 'user' or 'ai'
-            message TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with pool.get(write=True) as conn:
+        cursor = conn.cursor()
+        # Users table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL UNIQUE,
+                password TEXT NOT NULL
+            )
+        ''')
+        # Agent state table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS agent_state (
+                user_id INTEGER PRIMARY KEY,
+                state_json BLOB NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        # Chat history table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                sender TEXT NOT NULL, -- 'user' or 'ai'
+                message TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        # Every hot history query orders by id, and an index on (user_id)
+        # carries the rowid, so rehydration (ORDER BY id) and pagination
+        # (AND id < ? ORDER BY id DESC LIMIT) both walk it directly with no
+        # sort step. The old (user_id, timestamp) index forced a temp
+        # B-tree sort on all of them.
+        cursor.execute('DROP INDEX IF EXISTS idx_chat_history_user_ts')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_chat_history_user
+            ON chat_history (user_id)
+        ''')
+        conn.commit()
 
 # --- Helper Functions for State and History ---
+@functools.lru_cache(maxsize=1024)
 def get_user_id(username):
-    """Gets user ID from username."""
-    conn = get_db_connection()
-    user = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
-    conn.close()
+    """Gets user ID from username.
+
+    Cached because usernames are UNIQUE and ids never change; this is only
+    a fallback for sessions created before user_id was stored in the cookie.
+    """
+    with pool.get() as conn:
+        user = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
     return user['id'] if user else None
 
-def save_agent_state(user_id, state):
-    """Serializes and saves the agent's state to the database."""
+def save_agent_state(user_id, state, conn=None):
+    """Serializes and saves the agent's state to the database.
+
+    If a connection is passed in, the write joins the caller's transaction
+    and the caller is responsible for committing.
+
+    Messages are excluded from the snapshot: they are already persisted
+    row-by-row in chat_history, so serializing the whole history here
+    would rewrite an ever-growing JSON blob on every turn.
+    """
     state_to_save = state.copy()
-    state_to_save['messages'] = messages_to_dict(state['messages'])
-    state_json = json.dumps(state_to_save)
-    
-    conn = get_db_connection()
-    conn.execute(
-        'INSERT OR REPLACE INTO agent_state (user_id, state_json) VALUES (?, ?)',
-        (user_id, state_json)
-    )
-    conn.commit()
-    conn.close()
-
-def load_agent_state(user_id):
-    """Loads and deserializes the agent's state from the database."""
-    conn = get_db_connection()
-    row = conn.execute('SELECT state_json FROM agent_state WHERE user_id = ?', (user_id,)).fetchone()
-    conn.close()
-    
-    if row:
-        state_json = row['state_json']
-        loaded_state = json.loads(state_json)
-        loaded_state['messages'] = messages_from_dict(loaded_state['messages'])
-        return loaded_state
-    return None
-
-def save_chat_message(user_id, sender, message):
-    """Saves a chat message to the history table."""
-    conn = get_db_connection()
-    conn.execute(
-        'INSERT INTO chat_history (user_id, sender, message) VALUES (?, ?, ?)',
-        (user_id, sender, message)
-    )
-    conn.commit()
-    conn.close()
-
-def load_chat_history(user_id):
-    """Loads all chat messages for a user."""
-    conn = get_db_connection()
-    messages = conn.execute(
-        'SELECT sender, message, timestamp FROM chat_history WHERE user_id = ? ORDER BY timestamp ASC',
+    state_to_save.pop('messages', None)
+    # Runtime-only: an in-flight search future is not serializable and
+    # belongs to the turn that created it.
+    state_to_save.pop('search_future', None)
+    # orjson serializes in C and returns bytes directly, which go into the
+    # BLOB column without a str->bytes re-encode.
+    state_json = orjson.dumps(state_to_save)
+
+    if conn is not None:
+        conn.execute(
+            'INSERT OR REPLACE INTO agent_state (user_id, state_json) VALUES (?, ?)',
+            (user_id, state_json)
+        )
+    else:
+        with pool.get(write=True) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO agent_state (user_id, state_json) VALUES (?, ?)',
+                (user_id, state_json)
+            )
+            conn.commit()
+
+def load_agent_state(user_id, conn=None):
+    """Loads and deserializes the agent's state from the database.
+
+    The message history is rebuilt from chat_history rather than stored in
+    the state snapshot itself (see save_agent_state).
+    """
+    if conn is not None:
+        row = conn.execute('SELECT state_json FROM agent_state WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        return _rehydrate_state(row['state_json'], user_id, conn)
+    with pool.get() as conn:
+        row = conn.execute('SELECT state_json FROM agent_state WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        return _rehydrate_state(row['state_json'], user_id, conn)
+
+def _row_to_message(row):
+    """Converts a chat_history row into its typed message."""
+    if row['sender'] == 'ai':
+        return AIMessage(content=row['message'])
+    return HumanMessage(content=row['message'])
+
+def _rehydrate_state(state_json, user_id, conn):
+    """Deserializes a state snapshot and rebuilds its message history."""
+    loaded_state = orjson.loads(state_json)
+    # Snapshots never contain messages (see save_agent_state); the history
+    # lives one row per turn in chat_history. Ordering by id is exact where
+    # timestamps only have one-second resolution.
+    rows = conn.execute(
+        'SELECT sender, message FROM chat_history WHERE user_id = ? ORDER BY id',
         (user_id,)
     ).fetchall()
-    conn.close()
-    return [dict(msg) for msg in messages]
+    loaded_state['messages'] = [_row_to_message(r) for r in rows]
+    return loaded_state
+
+def save_chat_message(user_id, sender, message, conn=None):
+    """Saves a chat message to the history table.
+
+    If a connection is passed in, the write joins the caller's transaction
+    and the caller is responsible for committing.
+    """
+    if conn is not None:
+        conn.execute(
+            'INSERT INTO chat_history (user_id, sender, message) VALUES (?, ?, ?)',
+            (user_id, sender, message)
+        )
+    else:
+        with pool.get(write=True) as conn:
+            conn.execute(
+                'INSERT INTO chat_history (user_id, sender, message) VALUES (?, ?, ?)',
+                (user_id, sender, message)
+            )
+            conn.commit()
+
+HISTORY_PAGE_SIZE = 50
+
+def load_chat_history(user_id, conn=None, before_id=None, limit=HISTORY_PAGE_SIZE):
+    """Loads one page of chat messages for a user, oldest-first.
+
+    Cursor-based: pass before_id (the id of the oldest message already
+    held) to fetch the preceding page, so the response stays a constant
+    size however long the conversation grows.
+    """
+    query = 'SELECT id, sender, message, timestamp FROM chat_history WHERE user_id = ?'
+    params = [user_id]
+    if before_id is not None:
+        query += ' AND id < ?'
+        params.append(before_id)
+    query += ' ORDER BY id DESC LIMIT ?'
+    params.append(limit)
+
+    if conn is not None:
+        messages = conn.execute(query, params).fetchall()
+    else:
+        with pool.get() as conn:
+            messages = conn.execute(query, params).fetchall()
+    return [dict(msg) for msg in reversed(messages)]
 
 def clear_user_session(user_id):
     """Clears agent state and chat history for a user."""
-    conn = get_db_connection()
-    conn.execute('DELETE FROM agent_state WHERE user_id = ?', (user_id,))
-    conn.execute('DELETE FROM chat_history WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with pool.get(write=True) as conn:
+        conn.execute('DELETE FROM agent_state WHERE user_id = ?', (user_id,))
+        conn.execute('DELETE FROM chat_history WHERE user_id = ?', (user_id,))
+        conn.commit()
 
 # --- User Authentication Routes ---
 @app.route('/login', methods=['GET', 'POST'])
@@ -129,13 +280,13 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
+        with pool.get() as conn:
+            user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
 
         if user and check_password_hash(user['password'], password):
             session['logged_in'] = True
             session['username'] = user['username']
+            session['user_id'] = user['id']
             return redirect(url_for('product'))
         else:
             return render_template('login.html', error='Invalid credentials')
@@ -147,15 +298,15 @@ def signin():
         username = request.form['username']
         password = request.form['password']
         
-        hashed_password = generate_password_hash(password)
+        hashed_password = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
         
         try:
-            conn = get_db_connection()
-            conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, hashed_password))
-            conn.commit()
-            conn.close()
+            with pool.get(write=True) as conn:
+                cursor = conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, hashed_password))
+                conn.commit()
             session['logged_in'] = True
             session['username'] = username
+            session['user_id'] = cursor.lastrowid
             return redirect(url_for('product'))
         except sqlite3.IntegrityError:
             return render_template('signin.html', error='Username already exists')
@@ -184,24 +335,76 @@ def manage_session():
         return jsonify({'error': 'Unauthorized'}), 401
     
     username = session.get('username')
-    user_id = get_user_id(username)
+    user_id = session.get('user_id') or get_user_id(username)
     if not user_id:
         return jsonify({'error': 'User not found'}), 404
 
     if request.method == 'GET':
-        history = load_chat_history(user_id)
-        state = load_agent_state(user_id)
+        before_id = request.args.get('before_id', type=int)
+        # One pooled connection for both reads: a single transaction, and a
+        # consistent WAL snapshot across history and state. The client only
+        # needs to know whether a state exists, so this checks for the row
+        # instead of rehydrating the whole conversation on every page load.
+        with pool.get() as conn:
+            history = load_chat_history(user_id, conn=conn, before_id=before_id)
+            has_state = conn.execute(
+                'SELECT 1 FROM agent_state WHERE user_id = ?', (user_id,)
+            ).fetchone() is not None
+        # Cursor for the next (older) page; null when there is nothing left.
+        next_cursor = history[0]['id'] if len(history) == HISTORY_PAGE_SIZE else None
         return jsonify({
             'history': history,
-            'state': state is not None
+            'next_cursor': next_cursor,
+            'state': has_state
         })
 
     if request.method == 'DELETE':
         clear_user_session(user_id)
-        if username in agent_cache:
-            del agent_cache[username] # Clear from cache as well
+        evict_agent(username) # Clear from cache as well
         return jsonify({'status': 'ok'})
 
+def _run_agent_turn(agent, user_id, username, user_input, stream_handler=None):
+    """Runs one conversation turn and persists it.
+
+    Shared by /api/chat and /api/chat/stream so the two endpoints cannot
+    drift. A stream_handler, when given, rides the run config so it belongs
+    to this invocation only -- the agent instance is shared across requests.
+
+    Returns the response payload dict for the client.
+    """
+    current_state = load_agent_state(user_id)
+    config = {'configurable': {'stream_handler': stream_handler}}
+
+    if current_state is None:
+        print(f"---STARTING NEW SESSION FOR {username}---")
+        initial_state = AgentState(
+            topic=user_input, messages=[], user_response="", lesson_plan=[], current_lesson_index=0)
+        final_state = agent.graph.invoke(initial_state, config=config)
+    else:
+        print(f"---CONTINUING SESSION FOR {username}---")
+        current_state['user_response'] = user_input
+        final_state = agent.graph.invoke(current_state, config=config)
+
+    response_data = {}
+    if final_state is None:
+        response_data['message'] = "Congratulations! You have completed the lesson plan."
+        response_data['is_finished'] = True
+        clear_user_session(user_id) # Clean up the session from DB
+    else:
+        ai_message = final_state['messages'][-1].content
+        response_data['lesson_plan'] = final_state.get('lesson_plan')
+        response_data['message'] = ai_message
+        # Persist the user message, new state and AI reply in one
+        # transaction: a single fsync instead of three, and no
+        # half-written turn if the process dies mid-way.
+        with pool.get(write=True) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            save_chat_message(user_id, 'user', user_input, conn=conn)
+            save_agent_state(user_id, final_state, conn=conn)
+            save_chat_message(user_id, 'ai', ai_message, conn=conn)
+            conn.commit()
+    return response_data
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     if not session.get('logged_in'):
@@ -210,51 +413,74 @@ def chat():
     data = request.json
     user_input = data.get('message')
     username = session.get('username')
-    user_id = get_user_id(username)
+    user_id = session.get('user_id') or get_user_id(username)
 
     if not user_id:
         return jsonify({'error': 'User not found'}), 404
 
-    save_chat_message(user_id, 'user', user_input)
-
     # Get or create agent instance
-    if username not in agent_cache:
-        agent_cache[username] = TutorAgent()
-    agent = agent_cache[username]
-    
-    current_state = load_agent_state(user_id)
-    response_data = {}
+    agent = get_agent(username)
 
     try:
-        if current_state is None:
-            print(f"---STARTING NEW SESSION FOR {username}---")
-            initial_state = AgentState(
-                topic=user_input, messages=[], user_response="", lesson_plan=[], current_lesson_index=0)
-            final_state = agent.graph.invoke(initial_state)
-        else:
-            print(f"---CONTINUING SESSION FOR {username}---")
-            current_state['user_response'] = user_input
-            final_state = agent.graph.invoke(current_state)
-
-        if final_state is None:
-            response_data['message'] = "Congratulations! You have completed the lesson plan."
-            response_data['is_finished'] = True
-            clear_user_session(user_id) # Clean up the session from DB
-        else:
-            ai_message = final_state['messages'][-1].content
-            response_data['lesson_plan'] = final_state.get('lesson_plan')
-            response_data['message'] = ai_message
-            save_agent_state(user_id, final_state)
-            save_chat_message(user_id, 'ai', ai_message)
-    
+        response_data = _run_agent_turn(agent, user_id, username, user_input)
     except Exception as e:
         print(f"An error occurred in the agent graph: {e}")
-        response_data['message'] = "Sorry, an internal error occurred. Please try again or start a new topic."
-        response_data['is_error'] = True
-
+        response_data = {
+            'message': "Sorry, an internal error occurred. Please try again or start a new topic.",
+            'is_error': True
+        }
 
     return jsonify(response_data)
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Streaming variant of /api/chat using server-sent events.
+
+    Tokens are forwarded to the client as the LLM produces them, so the user
+    starts reading at time-to-first-token instead of waiting for the whole
+    explanation. The final 'done' event carries the same payload /api/chat
+    returns, and nothing is persisted until generation has completed.
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.json
+    user_input = data.get('message')
+    username = session.get('username')
+    user_id = session.get('user_id') or get_user_id(username)
+
+    if not user_id:
+        return jsonify({'error': 'User not found'}), 404
+
+    agent = get_agent(username)
+    events = queue.Queue()
+
+    def run_turn():
+        try:
+            response_data = _run_agent_turn(
+                agent, user_id, username, user_input,
+                stream_handler=lambda token: events.put(('token', token))
+            )
+        except Exception as e:
+            print(f"An error occurred in the agent graph: {e}")
+            response_data = {
+                'message': "Sorry, an internal error occurred. Please try again or start a new topic.",
+                'is_error': True
+            }
+        events.put(('done', response_data))
+
+    def generate():
+        threading.Thread(target=run_turn, daemon=True).start()
+        while True:
+            kind, payload = events.get()
+            if kind == 'token':
+                yield 'data: ' + orjson.dumps({'token': payload}).decode() + '\n\n'
+                continue
+            yield 'event: done\ndata: ' + orjson.dumps(payload).decode() + '\n\n'
+            return
+
+    return Response(generate(), mimetype='text/event-stream')
+
 if __name__ == '__main__':
     init_db()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,15 @@
+import os
+
+# Run with: gunicorn wsgi:app
+# Threaded workers, because most of a chat request is spent waiting on the
+# LLM over the network; the Flask dev server would serialize every user
+# behind one in-flight generation.
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+
+def post_fork(server, worker):
+    # SQLite connections are not fork-safe; rebuild the pool per worker.
+    from app import reset_pool
+    reset_pool()
@@ -1,6 +1,7 @@
 import os
 import json
-from typing import TypedDict, Annotated, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypedDict, Annotated, List
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage
 from pydantic import BaseModel, Field, conlist
 from langchain_ollama.chat_models import ChatOllama
@@ -9,6 +10,7 @@ from langchain_community.tools.tavily_search import TavilySearchResults
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
 from src.pipeline.rag import RAGPipeline
+from src.pipeline.semantic_cache import SemanticCache
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -24,12 +26,16 @@ class AgentState(TypedDict):
         current_lesson_index (int): The index of the current lesson in the plan.
         messages (List[BaseMessage]): The history of messages in the conversation.
         user_response (str): The latest response from the user.
+        search_future (Any): In-flight background search/indexing for this
+            turn, if any. Runtime-only: set by plan_lessons, joined and
+            cleared by deliver_lesson, never persisted.
     """
     topic: str
     lesson_plan: List[str]
     current_lesson_index: int
     messages: Annotated[List[BaseMessage], lambda x, y: x + y]
     user_response: str
+    search_future: Any
 
 class LessonPlan(BaseModel):
     """Data model for a lesson plan."""
@@ -67,6 +73,180 @@ class LessonPlanWrapper(BaseModel):
     """A wrapper to match the LLM's top-level 'lesson_plan' key."""
     lesson_plan: FullLessonPlan
 
+# --- NODE DEFINITIONS ---
+# These are the individual actions our agent can take. The graph structure
+# does not depend on any per-user state, so the nodes live at module level
+# and receive the owning TutorAgent through the run config; this lets the
+# graph be compiled once at import instead of once per agent.
+
+def _get_agent(config):
+    return config["configurable"]["agent"]
+
+def _get_stream_handler(config):
+    # Per-invocation: the handler rides the run config rather than living on
+    # the shared agent, so concurrent turns for one user cannot steal each
+    # other's token streams.
+    return config["configurable"].get("stream_handler")
+
+def plan_lessons_node(state: AgentState, config):
+    print("---PLANNING LESSONS---")
+    agent = _get_agent(config)
+    # Kick off search + indexing now; planning does not depend on it, so the
+    # two multi-second operations run concurrently. The future travels in
+    # state -- the agent is shared across requests, so stashing it there
+    # would let concurrent turns join or clear each other's searches.
+    search_future = agent._executor.submit(agent._do_search, state['topic'])
+    cached_plan = agent.semantic_cache.lookup('lesson_plan', state['topic'])
+    if cached_plan is not None:
+        return {
+            "lesson_plan": json.loads(cached_plan),
+            "current_lesson_index": 0,
+            "search_future": search_future
+        }
+    messages = [
+        SystemMessage(
+            content=(
+                "You are an expert curriculum designer. Create a comprehensive, session-based "
+                "lesson plan for the given topic. The plan should include learning objectives "
+                "and a list of sessions, each with a list of activity strings. "
+                "Respond with a single JSON object wrapped in a 'lesson_plan' key."
+            )
+        ),
+        HumanMessage(content=f"Create a detailed lesson plan for the topic: {state['topic']}")
+    ]
+    response = agent.structured_llm.invoke(messages)
+    full_plan = response.lesson_plan
+    all_activities = [activity for session in full_plan.sessions for activity in session.activities]
+    agent.semantic_cache.store('lesson_plan', state['topic'], json.dumps(all_activities))
+    return {
+        "lesson_plan": all_activities,
+        "current_lesson_index": 0,
+        "search_future": search_future
+    }
+
+# NEW NODE: This node's only job is to update the lesson index
+def update_index_node(state: AgentState):
+    print("---UPDATING LESSON INDEX---")
+    current_index = state["current_lesson_index"]
+    new_index = current_index + 1
+    return {"current_lesson_index": new_index}
+
+def deliver_lesson_node(state: AgentState, config):
+    print("---DELIVERING LESSON---")
+    agent = _get_agent(config)
+    plan = state["lesson_plan"]
+    idx = state["current_lesson_index"]
+    current_lesson_topic = plan[idx]
+    stream_handler = _get_stream_handler(config)
+    explanation = agent.semantic_cache.lookup('lesson_explanation', current_lesson_topic)
+    if explanation is not None and stream_handler is not None:
+        stream_handler(explanation) # Cached: one chunk, instantly
+    if explanation is None:
+        agent._wait_for_search(state.get("search_future")) # The retriever needs the indexed results
+        retriever = agent.rag_pipeline.get_retriever()
+        retrieved_docs = retriever.invoke(current_lesson_topic)
+        context = "\n\n".join([doc.page_content for doc in retrieved_docs])
+        prompt = (
+            f"You are an AI Tutor. Explain the following lesson to me in a simple and "
+            f"easy-to-understand way. Use the provided context to ensure accuracy.\n\n"
+            f"Lesson: {current_lesson_topic}\n\n"
+            f"Context from research:\n{context}\n\n"
+            f"Your Explanation:"
+        )
+        explanation = agent._generate(prompt, stream_handler)
+        agent.semantic_cache.store('lesson_explanation', current_lesson_topic, explanation)
+    next_lesson_preview = ""
+    if idx + 1 < len(plan):
+        next_lesson_preview = f"\n\n*Next up: {plan[idx+1]}*"
+    message_content = explanation + next_lesson_preview
+    # IMPORTANT: Clear the user response so this logic doesn't re-trigger,
+    # and drop the consumed future so it never reaches the state snapshot.
+    return {
+        "messages": [HumanMessage(content=message_content)],
+        "user_response": "",
+        "search_future": None
+    }
+
+def simplify_lesson_node(state: AgentState, config):
+    print("---SIMPLIFYING LESSON---")
+    agent = _get_agent(config)
+    last_lesson = state["messages"][-1].content.split("\n\n*Next up")[0]
+    prompt = (
+        f"You are an AI Tutor. Please re-explain the following lesson in an even "
+        f"simpler way, using analogies and simple examples if possible.\n\n"
+        f"Lesson to simplify:\n{last_lesson}\n\n"
+        f"Your Simplified Explanation:"
+    )
+    simplified = agent._generate(prompt, _get_stream_handler(config))
+    plan = state["lesson_plan"]
+    idx = state["current_lesson_index"]
+    next_lesson_preview = ""
+    if idx + 1 < len(plan):
+        next_lesson_preview = f"\n\n*Next up: {plan[idx+1]}*"
+    message_content = simplified + next_lesson_preview
+    # IMPORTANT: Clear the user response
+    return {"messages": [HumanMessage(content=message_content)], "user_response": ""}
+
+# --- ROUTER LOGIC ---
+def route_logic(state: AgentState):
+    if not state.get("lesson_plan"):
+        print("Router: No plan. Planning new lesson.")
+        return "plan_lessons"
+
+    user_resp = state.get("user_response", "").lower()
+
+    if "next" in user_resp:
+        if state["current_lesson_index"] + 1 < len(state["lesson_plan"]):
+            print("Router: User wants next lesson. Routing to update index.")
+            return "update_index" # Route to the state update node
+        else:
+            print("Router: End of plan.")
+            return END
+
+    if "replay" in user_resp:
+        print("Router: User wants to simplify lesson.")
+        return "simplify_lesson"
+
+    return END
+
+def _build_graph():
+    """
+    Builds the computational graph for the agent's workflow using a robust router pattern.
+    """
+    print("Building agent graph...")
+    workflow = StateGraph(AgentState)
+
+    workflow.add_node("plan_lessons", plan_lessons_node)
+    workflow.add_node("update_index", update_index_node) # Add the new node
+    workflow.add_node("deliver_lesson", deliver_lesson_node)
+    workflow.add_node("simplify_lesson", simplify_lesson_node)
+
+    workflow.set_conditional_entry_point(
+        route_logic,
+        {
+            "plan_lessons": "plan_lessons",
+            "update_index": "update_index", # Add the new route
+            "simplify_lesson": "simplify_lesson",
+            END: END,
+        },
+    )
+
+    # Search runs in the background from plan_lessons; deliver_lesson
+    # joins on it only when it actually needs the retriever.
+    workflow.add_edge("plan_lessons", "deliver_lesson")
+
+    # New flow for "next" command
+    workflow.add_edge("update_index", "deliver_lesson")
+
+    workflow.add_edge("deliver_lesson", END)
+    workflow.add_edge("simplify_lesson", END)
+
+    print("Agent graph built.")
+    return workflow.compile()
+
+# Compiled once per process; every TutorAgent shares it.
+_COMPILED_GRAPH = _build_graph()
+
 class TutorAgent:
     """
     The main class for the AI Tutoring Agent.
@@ -81,149 +261,51 @@ class TutorAgent:
         """
         print("Initializing Tutor Agent...")
         self.llm = ChatOllama(model=ollama_model, temperature=0)
+        self.structured_llm = self.llm.with_structured_output(LessonPlanWrapper)
         self.rag_pipeline = RAGPipeline()
+        # Many users ask for the same topics, so lesson plans and
+        # explanations are cached by embedding similarity to skip the LLM.
+        self.semantic_cache = SemanticCache(self.rag_pipeline.embeddings)
         self.tools = [TavilySearchResults(max_results=5)]
         self.tool_node = ToolNode(self.tools)
-        self.graph = self._build_graph()
+        # Web search + embedding run on this executor so they overlap with
+        # the lesson-planning LLM call instead of running after it.
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        # The shared pre-compiled graph, bound so nodes can reach this agent
+        # through the run config.
+        self.graph = _COMPILED_GRAPH.with_config(configurable={"agent": self})
         print("Tutor Agent Initialized.")
 
-    def _build_graph(self):
-        """
-        Builds the computational graph for the agent's workflow using a robust router pattern.
-        """
-        print("Building agent graph...")
-        structured_llm = self.llm.with_structured_output(LessonPlanWrapper)
-
-        # --- NODE DEFINITIONS ---
-        # These are the individual actions our agent can take.
-
-        def plan_lessons_node(state: AgentState):
-            print("---PLANNING LESSONS---")
-            messages = [
-                SystemMessage(
-                    content=(
-                        "You are an expert curriculum designer. Create a comprehensive, session-based "
-                        "lesson plan for the given topic. The plan should include learning objectives "
-                        "and a list of sessions, each with a list of activity strings. "
-                        "Respond with a single JSON object wrapped in a 'lesson_plan' key."
-                    )
-                ),
-                HumanMessage(content=f"Create a detailed lesson plan for the topic: {state['topic']}")
-            ]
-            response = structured_llm.invoke(messages)
-            full_plan = response.lesson_plan
-            all_activities = [activity for session in full_plan.sessions for activity in session.activities]
-            return {"lesson_plan": all_activities, "current_lesson_index": 0}
-
-        def search_content_node(state: AgentState):
-            print("---SEARCHING FOR CONTENT---")
-            topic = state["topic"]
-            search_results = self.tools[0].invoke({"query": f"In-depth educational content on {topic}"})
-            documents_for_rag = [result['content'] for result in search_results]
-            self.rag_pipeline.add_documents_to_vectorstore(documents_for_rag)
-            return {}
-
-        # NEW NODE: This node's only job is to update the lesson index
-        def update_index_node(state: AgentState):
-            print("---UPDATING LESSON INDEX---")
-            current_index = state["current_lesson_index"]
-            new_index = current_index + 1
-            return {"current_lesson_index": new_index}
-
-        def deliver_lesson_node(state: AgentState):
-            print("---DELIVERING LESSON---")
-            plan = state["lesson_plan"]
-            idx = state["current_lesson_index"]
-            current_lesson_topic = plan[idx]
-            retriever = self.rag_pipeline.get_retriever()
-            retrieved_docs = retriever.invoke(current_lesson_topic)
-            context = "\n\n".join([doc.page_content for doc in retrieved_docs])
-            prompt = (
-                f"You are an AI Tutor. Explain the following lesson to me in a simple and "
-                f"easy-to-understand way. Use the provided context to ensure accuracy.\n\n"
-                f"Lesson: {current_lesson_topic}\n\n"
-                f"Context from research:\n{context}\n\n"
-                f"Your Explanation:"
-            )
-            response = self.llm.invoke(prompt)
-            next_lesson_preview = ""
-            if idx + 1 < len(plan):
-                next_lesson_preview = f"\n\n*Next up: {plan[idx+1]}*"
-            message_content = response.content + next_lesson_preview
-            # IMPORTANT: Clear the user response so this logic doesn't re-trigger
-            return {"messages": [HumanMessage(content=message_content)], "user_response": ""}
-
-        def simplify_lesson_node(state: AgentState):
-            print("---SIMPLIFYING LESSON---")
-            last_lesson = state["messages"][-1].content.split("\n\n*Next up")[0]
-            prompt = (
-                f"You are an AI Tutor. Please re-explain the following lesson in an even "
-                f"simpler way, using analogies and simple examples if possible.\n\n"
-                f"Lesson to simplify:\n{last_lesson}\n\n"
-                f"Your Simplified Explanation:"
-            )
-            response = self.llm.invoke(prompt)
-            plan = state["lesson_plan"]
-            idx = state["current_lesson_index"]
-            next_lesson_preview = ""
-            if idx + 1 < len(plan):
-                next_lesson_preview = f"\n\n*Next up: {plan[idx+1]}*"
-            message_content = response.content + next_lesson_preview
-            # IMPORTANT: Clear the user response
-            return {"messages": [HumanMessage(content=message_content)], "user_response": ""}
-
-        # --- ROUTER LOGIC ---
-        def route_logic(state: AgentState):
-            if not state.get("lesson_plan"):
-                print("Router: No plan. Planning new lesson.")
-                return "plan_lessons"
-
-            user_resp = state.get("user_response", "").lower()
-
-            if "next" in user_resp:
-                if state["current_lesson_index"] + 1 < len(state["lesson_plan"]):
-                    print("Router: User wants next lesson. Routing to update index.")
-                    return "update_index" # Route to the state update node
-                else:
-                    print("Router: End of plan.")
-                    return END
-            
-            if "replay" in user_resp:
-                print("Router: User wants to simplify lesson.")
-                return "simplify_lesson"
+    def _do_search(self, topic: str):
+        """Searches the web for a topic and indexes the results for RAG."""
+        print("---SEARCHING FOR CONTENT---")
+        search_results = self.tools[0].invoke({"query": f"In-depth educational content on {topic}"})
+        documents_for_rag = [result['content'] for result in search_results]
+        self.rag_pipeline.add_documents_to_vectorstore(documents_for_rag)
 
-            return END
+    @staticmethod
+    def _wait_for_search(search_future):
+        """Blocks until the given background search has been indexed."""
+        if search_future is not None:
+            search_future.result()
 
-        # --- GRAPH DEFINITION ---
-        workflow = StateGraph(AgentState)
-
-        workflow.add_node("plan_lessons", plan_lessons_node)
-        workflow.add_node("search_content", search_content_node)
-        workflow.add_node("update_index", update_index_node) # Add the new node
-        workflow.add_node("deliver_lesson", deliver_lesson_node)
-        workflow.add_node("simplify_lesson", simplify_lesson_node)
-
-        workflow.set_conditional_entry_point(
-            route_logic,
-            {
-                "plan_lessons": "plan_lessons",
-                "update_index": "update_index", # Add the new route
-                "simplify_lesson": "simplify_lesson",
-                END: END,
-            },
-        )
-        
-        workflow.add_edge("plan_lessons", "search_content")
-        workflow.add_edge("search_content", "deliver_lesson")
-        
-        # New flow for "next" command
-        workflow.add_edge("update_index", "deliver_lesson")
-
-        workflow.add_edge("deliver_lesson", END)
-        workflow.add_edge("simplify_lesson", END)
-
-        print("Agent graph built.")
-        return workflow.compile()
+    def _generate(self, prompt: str, stream_handler=None) -> str:
+        """
+        Generates a completion for a prompt.
+
+        Streams token chunks through stream_handler when one is passed (the
+        streaming endpoint threads it through the run config), so the client
+        sees output at time-to-first-token instead of waiting for the whole
+        generation; otherwise falls back to a blocking invoke.
+        """
+        if stream_handler is None:
+            return self.llm.invoke(prompt).content
+        parts = []
+        for chunk in self.llm.stream(prompt):
+            if chunk.content:
+                parts.append(chunk.content)
+                stream_handler(chunk.content)
+        return "".join(parts)
 
     def run(self, topic: str, user_response: str = None):
         """
@@ -0,0 +1,95 @@
+import logging
+import threading
+from typing import Any, List
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+class LSHQueryCache:
+    """
+    A random-projection LSH cache from query embeddings to retrieved documents.
+
+    Each query embedding is hashed through L tables of k random +/-1
+    hyperplanes; semantically similar queries land in the same buckets, so a
+    paraphrase of an earlier question finds its candidates by bucket lookup
+    and is verified with an exact cosine check instead of running a fresh
+    HNSW search.
+    """
+    def __init__(self, tables: int = 8, bits: int = 12, threshold: float = 0.95, seed: int = 0):
+        self.threshold = threshold
+        self._tables = tables
+        self._bits = bits
+        self._rng = np.random.default_rng(seed)
+        self._planes = None          # (tables, dim, bits), built on first use
+        self._buckets = [{} for _ in range(tables)]
+        self._entries = []           # list of (unit embedding, documents)
+        self._lock = threading.Lock()
+
+    def _signatures(self, vector: np.ndarray):
+        if self._planes is None:
+            self._planes = self._rng.choice(
+                [-1.0, 1.0], size=(self._tables, vector.shape[0], self._bits)
+            ).astype(np.float32)
+        bits = (vector @ self._planes) > 0          # (tables, bits)
+        weights = 1 << np.arange(self._bits)
+        return (bits @ weights).astype(int)          # one bucket key per table
+
+    def get(self, vector: np.ndarray):
+        """Returns the cached documents for a similar-enough query, else None."""
+        with self._lock:
+            if not self._entries:
+                return None
+            candidates = set()
+            for table, key in enumerate(self._signatures(vector)):
+                candidates.update(self._buckets[table].get(key, ()))
+            for index in candidates:
+                stored_vector, documents = self._entries[index]
+                if float(stored_vector @ vector) >= self.threshold:
+                    return documents
+        return None
+
+    def put(self, vector: np.ndarray, documents):
+        """Stores a query embedding and its retrieved documents."""
+        with self._lock:
+            index = len(self._entries)
+            self._entries.append((vector, documents))
+            for table, key in enumerate(self._signatures(vector)):
+                self._buckets[table].setdefault(key, []).append(index)
+
+    def clear(self):
+        """Drops all cached retrievals (call when the corpus changes)."""
+        with self._lock:
+            self._buckets = [{} for _ in range(self._tables)]
+            self._entries = []
+
+class CachedRetriever(BaseRetriever):
+    """
+    Wraps a retriever with an LSHQueryCache keyed by the query embedding.
+
+    A near-duplicate of a previous query returns the stored Document list in
+    well under a millisecond; misses fall through to the wrapped retriever
+    and populate the cache.
+    """
+    base_retriever: Any
+    embeddings: Any
+    cache: LSHQueryCache
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        query_vector = self._embed(query)
+        cached = self.cache.get(query_vector)
+        if cached is not None:
+            logger.info("Query cache hit")
+            return cached
+        documents = self.base_retriever.invoke(query)
+        self.cache.put(query_vector, documents)
+        return documents
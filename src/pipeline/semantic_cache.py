@@ -0,0 +1,128 @@
+import logging
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """
+    A small semantic cache for LLM responses, backed by SQLite.
+
+    Responses are stored alongside an embedding of the prompt that produced
+    them. A lookup first tries an exact hash match, then falls back to a
+    brute-force cosine search over the stored embeddings (cheap with NumPy at
+    the few-thousand-row scale this app sees). Anything above the similarity
+    threshold counts as a hit, so "python basics" and "basics of python"
+    share one stored lesson plan and skip the LLM call entirely.
+
+    Embeddings are stored int8-quantized: vectors are unit-normalized, so
+    round(v * 127) loses under 1% of cosine accuracy while shrinking each
+    BLOB 4x and letting the similarity scan move a quarter of the bytes.
+    """
+
+    # Bump when the stored embedding format changes; old rows are dropped.
+    SCHEMA_VERSION = 1
+    def __init__(self, embeddings, db_path: str = "llm_cache.db", threshold: float = 0.93):
+        """
+        Initializes the SemanticCache.
+
+        Args:
+            embeddings: An embeddings object exposing embed_query(text).
+            db_path (str): Path of the SQLite file holding cached responses.
+            threshold (float): Minimum cosine similarity for a semantic hit.
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < self.SCHEMA_VERSION:
+            self._conn.execute('DROP TABLE IF EXISTS llm_cache')
+            self._conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                namespace TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                PRIMARY KEY (namespace, prompt_hash)
+            )
+        ''')
+        self._conn.commit()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _quantize(vector: np.ndarray) -> bytes:
+        """Quantizes a unit vector to int8 (symmetric, scale 127)."""
+        return np.clip(np.round(vector * 127.0), -127, 127).astype(np.int8).tobytes()
+
+    @staticmethod
+    def _dequantize(blobs) -> np.ndarray:
+        """Rebuilds a row-normalized float32 matrix from int8 blobs."""
+        matrix = np.stack([np.frombuffer(b, dtype=np.int8) for b in blobs]).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def lookup(self, namespace: str, prompt: str):
+        """
+        Looks up a cached response for a prompt.
+
+        Args:
+            namespace (str): Cache bucket, e.g. 'lesson_plan'.
+            prompt (str): The prompt text to match against.
+
+        Returns:
+            The cached response string, or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT response FROM llm_cache WHERE namespace = ? AND prompt_hash = ?',
+                (namespace, self._hash(prompt))
+            ).fetchone()
+            if row:
+                return row[0]
+            rows = self._conn.execute(
+                'SELECT embedding, response FROM llm_cache WHERE namespace = ?',
+                (namespace,)
+            ).fetchall()
+        if not rows:
+            return None
+        query_vector = self._embed(prompt)
+        stored = self._dequantize([r[0] for r in rows])
+        similarities = stored @ query_vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            logger.info("Semantic cache hit (%s, sim=%.3f)", namespace, similarities[best])
+            return rows[best][1]
+        return None
+
+    def store(self, namespace: str, prompt: str, response: str):
+        """Stores a response under its prompt's hash and embedding."""
+        embedding = self._embed(prompt)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (namespace, prompt_hash, prompt, embedding, response) VALUES (?, ?, ?, ?, ?)',
+                (namespace, self._hash(prompt), prompt, self._quantize(embedding), response)
+            )
+            self._conn.commit()
+
+    def clear(self, namespace: str = None):
+        """Invalidates the cache, either one namespace or everything."""
+        with self._lock:
+            if namespace:
+                self._conn.execute('DELETE FROM llm_cache WHERE namespace = ?', (namespace,))
+            else:
+                self._conn.execute('DELETE FROM llm_cache')
+            self._conn.commit()
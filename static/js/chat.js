@@ -22,6 +22,8 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentLessonPlan = [];
     let currentLessonIndex = 0;
     let isFirstMessage = true;
+    let nextCursor = null;
+    let isLoadingOlder = false;
 
     loadSession();
 
@@ -37,15 +39,7 @@ document.addEventListener('DOMContentLoaded', () => {
         showTypingIndicator();
 
         try {
-            const response = await fetch('/api/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ message })
-            });
-
-            const data = await response.json();
+            const { data, bubble } = await streamChat(message);
             hideTypingIndicator();
 
             if (data.error) {
@@ -55,8 +49,15 @@ document.addEventListener('DOMContentLoaded', () => {
                     currentLessonPlan = data.lesson_plan;
                     updateLessonPlan(data.lesson_plan);
                 }
-                
-                addAIMessage(data.message);
+
+                if (bubble) {
+                    // Swap the streamed tokens for the final payload, which
+                    // also carries the next-lesson preview.
+                    bubble.innerHTML = formatMessage(data.message);
+                    scrollToBottom();
+                } else {
+                    addAIMessage(data.message);
+                }
 
                 if (data.is_finished) {
                     lessonControls.style.display = 'none';
@@ -95,22 +96,19 @@ document.addEventListener('DOMContentLoaded', () => {
         showTypingIndicator();
 
         try {
-            const response = await fetch('/api/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ message: action })
-            });
-
-            const data = await response.json();
+            const { data, bubble } = await streamChat(action);
             hideTypingIndicator();
 
             if (data.error) {
                 addSystemMessage('Error: ' + data.error);
             } else {
-                addAIMessage(data.message);
-                
+                if (bubble) {
+                    bubble.innerHTML = formatMessage(data.message);
+                    scrollToBottom();
+                } else {
+                    addAIMessage(data.message);
+                }
+
                 if (action === 'next') {
                     currentLessonIndex++;
                     updateLessonProgress();
@@ -133,6 +131,83 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function createStreamingMessage() {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = 'message ai';
+        messageDiv.innerHTML = `
+            <div class="message-avatar">🤖</div>
+            <div class="message-content">
+                <div class="message-bubble"></div>
+                <div class="message-time">${getCurrentTime()}</div>
+            </div>
+        `;
+        chatMessages.appendChild(messageDiv);
+        return messageDiv.querySelector('.message-bubble');
+    }
+
+    async function streamChat(message) {
+        // POSTs to the SSE endpoint and renders tokens into an AI bubble as
+        // they arrive, so the reply appears at time-to-first-token. Resolves
+        // with the final 'done' payload and the bubble (null if nothing
+        // streamed, e.g. an error before generation started).
+        const response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ message })
+        });
+
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.includes('text/event-stream')) {
+            // Plain JSON error (e.g. session expired).
+            return { data: await response.json(), bubble: null };
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let bubble = null;
+        let streamedText = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const rawEvent of events) {
+                let eventName = 'message';
+                let dataLine = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) {
+                        eventName = line.slice(7).trim();
+                    } else if (line.startsWith('data: ')) {
+                        dataLine += line.slice(6);
+                    }
+                }
+                if (!dataLine) continue;
+
+                const payload = JSON.parse(dataLine);
+                if (eventName === 'done') {
+                    return { data: payload, bubble };
+                }
+                if (payload.token) {
+                    if (bubble === null) {
+                        hideTypingIndicator();
+                        bubble = createStreamingMessage();
+                    }
+                    streamedText += payload.token;
+                    bubble.innerHTML = formatMessage(streamedText);
+                    scrollToBottom();
+                }
+            }
+        }
+        // Stream ended without a 'done' event (connection dropped).
+        return { data: { error: 'Connection lost. Please try again.' }, bubble };
+    }
+
     function addUserMessage(text) {
         const welcomeMsg = chatMessages.querySelector('.welcome-message');
         if (welcomeMsg) {
@@ -250,11 +325,35 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function buildHistoryMessage(msg) {
+        const messageDiv = document.createElement('div');
+        if (msg.sender === 'user') {
+            messageDiv.className = 'message user';
+            messageDiv.innerHTML = `
+                <div class="message-avatar">👤</div>
+                <div class="message-content">
+                    <div class="message-bubble">${escapeHtml(msg.message)}</div>
+                    <div class="message-time">${formatTimestamp(msg.timestamp)}</div>
+                </div>
+            `;
+        } else {
+            messageDiv.className = 'message ai';
+            messageDiv.innerHTML = `
+                <div class="message-avatar">🤖</div>
+                <div class="message-content">
+                    <div class="message-bubble">${formatMessage(msg.message)}</div>
+                    <div class="message-time">${formatTimestamp(msg.timestamp)}</div>
+                </div>
+            `;
+        }
+        return messageDiv;
+    }
+
     async function loadSession() {
         try {
             const response = await fetch('/api/session');
             const data = await response.json();
-            
+
             if (data.history && data.history.length > 0) {
                 const welcomeMsg = chatMessages.querySelector('.welcome-message');
                 if (welcomeMsg) {
@@ -262,30 +361,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
 
                 data.history.forEach(msg => {
-                    if (msg.sender === 'user') {
-                        const messageDiv = document.createElement('div');
-                        messageDiv.className = 'message user';
-                        messageDiv.innerHTML = `
-                            <div class="message-avatar">👤</div>
-                            <div class="message-content">
-                                <div class="message-bubble">${escapeHtml(msg.message)}</div>
-                                <div class="message-time">${formatTimestamp(msg.timestamp)}</div>
-                            </div>
-                        `;
-                        chatMessages.appendChild(messageDiv);
-                    } else {
-                        const messageDiv = document.createElement('div');
-                        messageDiv.className = 'message ai';
-                        messageDiv.innerHTML = `
-                            <div class="message-avatar">🤖</div>
-                            <div class="message-content">
-                                <div class="message-bubble">${formatMessage(msg.message)}</div>
-                                <div class="message-time">${formatTimestamp(msg.timestamp)}</div>
-                            </div>
-                        `;
-                        chatMessages.appendChild(messageDiv);
-                    }
+                    chatMessages.appendChild(buildHistoryMessage(msg));
                 });
+                nextCursor = data.next_cursor;
 
                 isFirstMessage = false;
                 lessonControls.style.display = 'flex';
@@ -296,6 +374,38 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    async function loadOlderMessages() {
+        if (isLoadingOlder || nextCursor === null) return;
+        isLoadingOlder = true;
+
+        try {
+            const response = await fetch('/api/session?before_id=' + nextCursor);
+            const data = await response.json();
+
+            if (data.history && data.history.length > 0) {
+                const previousHeight = chatMessages.scrollHeight;
+                const fragment = document.createDocumentFragment();
+                data.history.forEach(msg => {
+                    fragment.appendChild(buildHistoryMessage(msg));
+                });
+                chatMessages.insertBefore(fragment, chatMessages.firstChild);
+                // Keep the viewport anchored on the message being read.
+                chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+            }
+            nextCursor = data.next_cursor;
+        } catch (error) {
+            console.error('Failed to load older messages:', error);
+        } finally {
+            isLoadingOlder = false;
+        }
+    }
+
+    chatMessages.addEventListener('scroll', () => {
+        if (chatMessages.scrollTop < 50) {
+            loadOlderMessages();
+        }
+    });
+
     function formatTimestamp(timestamp) {
         const date = new Date(timestamp);
         return date.toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit' });